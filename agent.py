@@ -3,7 +3,10 @@ import sys
 import os
 import re
 import json
-import requests
+import atexit
+import threading
+import time
+from functools import lru_cache
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from code_executor import CodeExecutor
@@ -14,6 +17,29 @@ from code_executor import CodeExecutor
 OLLAMA_BASE = "http://localhost:11434"
 DEFAULT_MODEL = "qwen3-coder-v4"
 FALLBACK_MODEL = "qwen3:4b"
+EMBED_MODEL = "nomic-embed-text"
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache.npz")
+# Auto-fix requests this many candidates at once, one per temperature.
+# Ollama only generates them in parallel when OLLAMA_NUM_PARALLEL >= this.
+FIX_TEMPERATURES = (0.4, 0.7, 0.9)
+MODELS_TTL = 30  # seconds to reuse the /api/tags result
+# Conversation history budget. NUM_CTX matches num_ctx in setup.py's Modelfile;
+# history gets ~3/4 of it (~4 chars per token), leaving room for the system
+# prompt and the reply, and never more than the last MAX_HISTORY messages.
+NUM_CTX = 2048
+CONTEXT_CHARS = NUM_CTX * 3 // 4 * 4
+SUMMARY_CHARS = 400
+MAX_HISTORY = 10
+
+# httpx and numpy are loaded on first use (see _http/_response_cache)
+# so the banner is not held up by importing the network and array stacks.
+_client = None
+_cache = None
+_fix_loop = None
+_pending_cache = {}  # response -> (embedding, context hash), cached once its code runs
+_async_client = None
+_lazy_lock = threading.Lock()
+_models_cache = {"t": 0.0, "v": None}
 
 SYSTEM_PROMPT = (
     "You are an expert Python programmer. "
@@ -38,125 +64,363 @@ class C:
     RESET = "\033[0m"
 
 
+# Plain text when output is not a terminal, or when NO_COLOR is set
+if not sys.stdout.isatty() or os.environ.get("NO_COLOR"):
+    for _name in ("BOLD", "DIM", "GREEN", "YELLOW", "RED", "CYAN", "MAGENTA", "RESET"):
+        setattr(C, _name, "")
+
+# Module-level aliases: a global lookup instead of an attribute lookup per use
+BOLD, DIM, GREEN, YELLOW, RED, CYAN, MAGENTA, RESET = (
+    C.BOLD, C.DIM, C.GREEN, C.YELLOW, C.RED, C.CYAN, C.MAGENTA, C.RESET
+)
+
+
 # ============================================================
 # LLM helpers (self-contained, no dependency on llm_backend.py)
 # ============================================================
+_THINK_CLOSED = re.compile(r"<think>.*?</think>\s*", re.DOTALL)
+_THINK_OPEN = re.compile(r"<think>.*", re.DOTALL)
+_CODE_PY = re.compile(r"```python\s*\n(.*?)```", re.DOTALL)
+_CODE_ANY = re.compile(r"```\s*\n(.*?)```", re.DOTALL)
+_FENCE_START = re.compile(r"^```python\s*\n?")
+_FENCE_END = re.compile(r"\n?```\s*$")
+_SUMMARY_PREFIX = "[earlier turns summarized: "
+
+
+def _http():
+    """One keep-alive HTTP/2 client for every Ollama call, so auto-fix loops
+    reuse the same connection instead of reconnecting per request."""
+    global _client
+    with _lazy_lock:
+        if _client is None:
+            import httpx
+            _client = httpx.Client(
+                http2=True,
+                timeout=httpx.Timeout(300.0, connect=10.0),
+                limits=httpx.Limits(max_keepalive_connections=8, max_connections=16, keepalive_expiry=30.0),
+            )
+            atexit.register(_client.close)
+    return _client
+
+
+def _response_cache():
+    global _cache
+    with _lazy_lock:
+        if _cache is None:
+            from semantic_cache import SemanticCache
+            _cache = SemanticCache(CACHE_PATH, embed)
+            atexit.register(_cache.save)
+    return _cache
+
+
+@lru_cache(maxsize=1)
 def get_model():
     config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".model_config")
-    if os.path.exists(config_path):
+    try:
         with open(config_path) as f:
-            return f.read().strip()
-    return DEFAULT_MODEL
+            return f.read(64).strip() or DEFAULT_MODEL
+    except FileNotFoundError:
+        return DEFAULT_MODEL
 
 
 def list_models():
+    if _models_cache["v"] and time.monotonic() - _models_cache["t"] < MODELS_TTL:
+        return _models_cache["v"]
     try:
-        r = requests.get(f"{OLLAMA_BASE}/api/tags", timeout=5)
-        return [m["name"] for m in r.json().get("models", [])]
+        r = _http().get(f"{OLLAMA_BASE}/api/tags", timeout=5)
+        models = [m["name"] for m in r.json().get("models", [])]
     except Exception:
         return []
+    _models_cache["t"], _models_cache["v"] = time.monotonic(), models
+    return models
+
+
+def embed(text):
+    try:
+        r = _http().post(f"{OLLAMA_BASE}/api/embeddings", json={
+            "model": EMBED_MODEL,
+            "prompt": text
+        }, timeout=30)
+        return r.json().get("embedding")
+    except Exception:
+        return None
 
 
 def strip_think(text):
-    text = re.sub(r"<think>.*?</think>\s*", "", text, flags=re.DOTALL)
-    text = re.sub(r"<think>.*", "", text, flags=re.DOTALL)
+    if "<think>" not in text:
+        return text.strip()
+    text = _THINK_CLOSED.sub("", text)
+    text = _THINK_OPEN.sub("", text)
     return text.strip()
 
 
 def extract_code(text):
     text = strip_think(text)
-    m = re.search(r"```python\s*\n(.*?)```", text, re.DOTALL)
+    # Fast path for the common ```python ... ``` reply: locate the fences with str.find
+    k = text.find("```python")
+    if k >= 0:
+        nl = text.find("\n", k + 9)
+        if nl >= 0 and not text[k + 9:nl].strip():
+            end = text.find("```", nl + 1)
+            if end >= 0:
+                return text[nl + 1:end].strip()
+    elif "```" not in text:
+        return _looks_like_code(text)
+    return _extract_code_re(text)
+
+
+def _looks_like_code(text):
+    cleaned = text.strip()
+    if cleaned and ("def " in cleaned or "print(" in cleaned or "import " in cleaned
+                     or "for " in cleaned or "class " in cleaned or "=" in cleaned):
+        return cleaned
+    return None
+
+
+def _extract_code_re(text):
+    m = _CODE_PY.search(text)
     if m:
         return m.group(1).strip()
-    m = re.search(r"```\s*\n(.*?)```", text, re.DOTALL)
+    m = _CODE_ANY.search(text)
     if m:
         return m.group(1).strip()
-    cleaned = text.strip()
-    if cleaned and ("def " in cleaned or "print(" in cleaned or "import " in cleaned
-                     or "for " in cleaned or "class " in cleaned or "=" in cleaned):
-        cleaned = re.sub(r"^```python\s*\n?", "", cleaned)
-        cleaned = re.sub(r"\n?```\s*$", "", cleaned)
+    cleaned = _looks_like_code(text)
+    if cleaned:
+        cleaned = _FENCE_START.sub("", cleaned)
+        cleaned = _FENCE_END.sub("", cleaned)
         return cleaned.strip()
     return None
 
 
-def chat(prompt, model, conversation=None):
+def _trim_by_budget(messages, max_chars=CONTEXT_CHARS, max_messages=MAX_HISTORY):
+    """Drop the oldest turns until at most max_messages remain and the total
+    content fits in max_chars. Dropped turns are folded into a short leading system note.
+    """
+    summary = ""
+    if messages and messages[0]["role"] == "system" and messages[0]["content"].startswith(_SUMMARY_PREFIX):
+        summary = messages[0]["content"][len(_SUMMARY_PREFIX):-1]
+        messages = messages[1:]
+    total = sum(len(m["content"]) for m in messages)
+    if total + len(summary) > max_chars or len(messages) > max_messages:
+        notes = [summary] if summary else []
+        i = 0
+        while i < len(messages) and (total > max_chars - SUMMARY_CHARS or len(messages) - i > max_messages):
+            m = messages[i]
+            total -= len(m["content"])
+            first_line = m["content"].strip().split("\n", 1)[0]
+            notes.append(f"{m['role']}: {first_line[:80]}")
+            i += 1
+        summary = "; ".join(notes)[-SUMMARY_CHARS:]
+        messages = messages[i:]
+    if not summary:
+        return list(messages)
+    return [{"role": "system", "content": f"{_SUMMARY_PREFIX}{summary}]"}] + list(messages)
+
+
+def build_messages(prompt, conversation=None):
     messages = [{"role": "system", "content": SYSTEM_PROMPT}]
     if conversation:
-        messages.extend(conversation[-10:])
+        messages.extend(_trim_by_budget(conversation, max(CONTEXT_CHARS - len(prompt), 0)))
     messages.append({"role": "user", "content": prompt})
+    return messages
+
+
+def chat(prompt, model, conversation=None, on_token=None):
+    """Stream a chat completion from Ollama.
+    on_token(text) is called for every content chunk as it arrives.
+    Returns (ok, full_response)
+    """
+    import httpx
+    messages = build_messages(prompt, conversation)
+    cache = _response_cache()
+    # Only reuse a response when the model and preceding context are identical
+    ctx_hash = cache.context_hash([model] + messages[:-1])
+    recent = "\n".join(m["content"] for m in messages[1:])[-2000:]
+    vec, cached = cache.lookup(recent, ctx_hash)
+    if cached is not None:
+        if on_token:
+            on_token("[cache-hit]\n")
+            on_token(cached)
+        return True, cached
     try:
-        r = requests.post(f"{OLLAMA_BASE}/api/chat", json={
+        parts = []
+        with _http().stream("POST", f"{OLLAMA_BASE}/api/chat", json={
             "model": model,
             "messages": messages,
-            "stream": False,
+            "stream": True,
             "options": {"temperature": 0.7, "top_p": 0.9}
-        }, timeout=300)
-        resp = r.json().get("message", {}).get("content", "")
+        }) as r:
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    return False, chunk["error"]
+                token = chunk.get("message", {}).get("content", "")
+                if token:
+                    parts.append(token)
+                    if on_token:
+                        on_token(token)
+                if chunk.get("done"):
+                    break
+        resp = "".join(parts)
+        _pending_cache.clear()
+        _pending_cache[resp] = (vec, ctx_hash)
         return True, resp
-    except requests.ConnectionError:
+    except httpx.ConnectError:
         return False, "Cannot connect to Ollama. Run 'ollama serve' first."
     except Exception as e:
         return False, str(e)
 
 
+def remember_response(response):
+    """Cache a chat() response once its code has run successfully."""
+    entry = _pending_cache.pop(response, None)
+    if entry is not None and _cache is not None:
+        _cache.add(entry[0], entry[1], response)
+
+
+def forget_response(response):
+    """Make sure a response whose code failed is not served from the cache again."""
+    _pending_cache.pop(response, None)
+    if _cache is not None:
+        _cache.remove(response)
+
+
+async def _fix_batch(prompt, model, k, on_candidate, conversation=None):
+    """Request k candidate fixes concurrently, each at a different temperature.
+    on_candidate(ok, response) is called as each one finishes and returns True
+    to accept it; the requests still in flight are then cancelled.
+    Returns True if a candidate was accepted.
+    """
+    import asyncio
+    import httpx
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(timeout=httpx.Timeout(300.0, connect=10.0))
+    messages = build_messages(prompt, conversation)
+
+    async def one(temperature):
+        try:
+            r = await _async_client.post(f"{OLLAMA_BASE}/api/chat", json={
+                "model": model,
+                "messages": messages,
+                "stream": False,
+                "options": {"temperature": temperature, "top_p": 0.9}
+            })
+            data = r.json()
+            if "error" in data:
+                return False, data["error"]
+            return True, data.get("message", {}).get("content", "")
+        except httpx.ConnectError:
+            return False, "Cannot connect to Ollama. Run 'ollama serve' first."
+        except Exception as e:
+            return False, str(e)
+
+    temps = [FIX_TEMPERATURES[i % len(FIX_TEMPERATURES)] for i in range(k)]
+    tasks = [asyncio.ensure_future(one(t)) for t in temps]
+    try:
+        for done in asyncio.as_completed(tasks):
+            if on_candidate(*await done):
+                return True
+        return False
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _close_fix_loop():
+    if _async_client is not None:
+        _fix_loop.run_until_complete(_async_client.aclose())
+    _fix_loop.close()
+
+
+def fix_batch(prompt, model, k, on_candidate, conversation=None):
+    """Run _fix_batch on one event loop kept for the whole session, so its
+    AsyncClient and connections are reused across auto-fix rounds."""
+    global _fix_loop
+    if _fix_loop is None:
+        import asyncio
+        _fix_loop = asyncio.new_event_loop()
+        atexit.register(_close_fix_loop)
+    return _fix_loop.run_until_complete(_fix_batch(prompt, model, k, on_candidate, conversation))
+
+
 # ============================================================
 # UI helpers
 # ============================================================
 def print_banner(model):
-    print(f"""{C.CYAN}{C.BOLD}
+    print(f"""{CYAN}{BOLD}
 ╔══════════════════════════════════════════╗
 ║         AI Code Agent  v4  CLI           ║
 ║   Local AI Coding Assistant (Offline)    ║
-╚══════════════════════════════════════════╝{C.RESET}
-{C.DIM}Model: {model} | Engine: Ollama{C.RESET}
-{C.DIM}Type your request. Commands: /help for list{C.RESET}""")
+╚══════════════════════════════════════════╝{RESET}
+{DIM}Model: {model} | Engine: Ollama{RESET}
+{DIM}Type your request. Commands: /help for list{RESET}""")
 
 
 def print_help():
-    print(f"""{C.BOLD}Commands:{C.RESET}
-  {C.CYAN}/run{C.RESET}            Re-run last code
-  {C.CYAN}/save <path>{C.RESET}    Save last code to file
-  {C.CYAN}/model{C.RESET}          Show/change model
-  {C.CYAN}/auto on|off{C.RESET}    Toggle auto-execution (default: on)
-  {C.CYAN}/max_fix <n>{C.RESET}    Set max auto-fix attempts (default: 3)
-  {C.CYAN}/help{C.RESET}           Show this help
-  {C.CYAN}/quit{C.RESET}           Exit
-
-{C.BOLD}Usage:{C.RESET}
+    print(f"""{BOLD}Commands:{RESET}
+  {CYAN}/run{RESET}            Re-run last code
+  {CYAN}/save <path>{RESET}    Save last code to file
+  {CYAN}/model{RESET}          Show/change model
+  {CYAN}/auto on|off{RESET}    Toggle auto-execution (default: on)
+  {CYAN}/max_fix <n>{RESET}    Set max auto-fix attempts (default: 3)
+  {CYAN}/help{RESET}           Show this help
+  {CYAN}/quit{RESET}           Exit
+
+{BOLD}Usage:{RESET}
   Type a request in natural language.
   The AI generates Python code, executes it, and auto-fixes errors.""")
 
 
+def write_out(text):
+    """Write text to stdout in a single call.
+    Off Windows this goes straight to fd 1, skipping the TextIOWrapper.
+    """
+    if os.name != "nt" and sys.stdout is sys.__stdout__:
+        sys.stdout.flush()
+        data = text.encode(sys.stdout.encoding or "utf-8", "replace")
+        while data:
+            data = data[os.write(1, data):]
+    else:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+
+def _indent(text):
+    return "".join(f"  {l}\n" for l in text.strip().split("\n"))
+
+
 def print_code(code):
     lines = code.split("\n")
     w = len(str(len(lines)))
-    for i, line in enumerate(lines, 1):
-        print(f"  {C.DIM}{str(i).rjust(w)} |{C.RESET} {line}")
+    write_out("".join(f"  {DIM}{str(i).rjust(w)} |{RESET} {line}\n" for i, line in enumerate(lines, 1)))
+
+
+def print_token(token):
+    sys.stdout.write(token)
+    sys.stdout.flush()
 
 
 def print_result(success, stdout, stderr, elapsed):
     if success:
-        print(f"\n{C.GREEN}{C.BOLD}[OK]{C.RESET} {C.DIM}({elapsed:.1f}s){C.RESET}")
+        parts = [f"\n{GREEN}{BOLD}[OK]{RESET} {DIM}({elapsed:.1f}s){RESET}\n"]
         if stdout.strip():
-            print(f"{C.GREEN}Output:{C.RESET}")
-            for l in stdout.strip().split("\n"):
-                print(f"  {l}")
+            parts += [f"{GREEN}Output:{RESET}\n", _indent(stdout)]
     else:
-        print(f"\n{C.RED}{C.BOLD}[ERROR]{C.RESET} {C.DIM}({elapsed:.1f}s){C.RESET}")
+        parts = [f"\n{RED}{BOLD}[ERROR]{RESET} {DIM}({elapsed:.1f}s){RESET}\n"]
         if stderr.strip():
-            print(f"{C.RED}Error:{C.RESET}")
-            for l in stderr.strip().split("\n"):
-                print(f"  {l}")
+            parts += [f"{RED}Error:{RESET}\n", _indent(stderr)]
         if stdout.strip():
-            print(f"{C.DIM}Output before error:{C.RESET}")
-            for l in stdout.strip().split("\n"):
-                print(f"  {l}")
+            parts += [f"{DIM}Output before error:{RESET}\n", _indent(stdout)]
+    write_out("".join(parts))
 
 
 def input_callback(prompt_text):
     try:
-        return input(f"{C.YELLOW}[input] {prompt_text}{C.RESET}")
+        return input(f"{YELLOW}[input] {prompt_text}{RESET}")
     except (EOFError, KeyboardInterrupt):
         return None
 
@@ -173,25 +437,31 @@ def main():
     auto_execute = True
     max_fix_attempts = 3
 
+    # Fetch the model list while the banner prints
+    prefetch = threading.Thread(target=list_models, daemon=True)
+    prefetch.start()
     print_banner(model)
 
+    prefetch.join()
     models = list_models()
     if not models:
-        print(f"{C.RED}Error: Cannot connect to Ollama. Run 'ollama serve' first.{C.RESET}")
+        print(f"{RED}Error: Cannot connect to Ollama. Run 'ollama serve' first.{RESET}")
         return
     model_bases = [m.split(":")[0] for m in models]
     if model not in model_bases and model not in models:
-        print(f"{C.YELLOW}Warning: Model '{model}' not found.{C.RESET}")
-        print(f"{C.DIM}Available: {', '.join(models)}{C.RESET}")
+        print(f"{YELLOW}Warning: Model '{model}' not found.{RESET}")
+        print(f"{DIM}Available: {', '.join(models)}{RESET}")
         if FALLBACK_MODEL.split(":")[0] in model_bases or FALLBACK_MODEL in models:
             model = FALLBACK_MODEL
-            print(f"{C.YELLOW}Using fallback: {model}{C.RESET}")
+            print(f"{YELLOW}Using fallback: {model}{RESET}")
+    # Boot the worker interpreter while the user types the first prompt
+    executor.start()
 
     while True:
         try:
-            user_input = input(f"\n{C.GREEN}{C.BOLD}You > {C.RESET}").strip()
+            user_input = input(f"\n{GREEN}{BOLD}You > {RESET}").strip()
         except (EOFError, KeyboardInterrupt):
-            print(f"\n{C.DIM}Bye!{C.RESET}")
+            print(f"\n{DIM}Bye!{RESET}")
             break
 
         if not user_input:
@@ -201,116 +471,128 @@ def main():
         if user_input.startswith("/"):
             cmd = user_input.lower().split()
             if cmd[0] == "/quit":
-                print(f"{C.DIM}Bye!{C.RESET}")
+                print(f"{DIM}Bye!{RESET}")
                 break
             if cmd[0] == "/help":
                 print_help()
                 continue
             if cmd[0] == "/run":
                 if last_code:
-                    print(f"\n{C.CYAN}Re-running last code...{C.RESET}")
-                    s, o, e, t = executor.execute(last_code)
+                    print(f"\n{CYAN}Re-running last code...{RESET}")
+                    s, o, e, t = executor.execute(last_code, mode="fast")
                     print_result(s, o, e, t)
                 else:
-                    print(f"{C.YELLOW}No code to run.{C.RESET}")
+                    print(f"{YELLOW}No code to run.{RESET}")
                 continue
             if cmd[0] == "/save":
                 if len(cmd) < 2:
-                    print(f"{C.YELLOW}Usage: /save <filepath>{C.RESET}")
+                    print(f"{YELLOW}Usage: /save <filepath>{RESET}")
                 elif last_code:
                     ok, msg = executor.save_code(last_code, cmd[1])
-                    print(f"{C.GREEN if ok else C.RED}{msg}{C.RESET}")
+                    print(f"{GREEN if ok else RED}{msg}{RESET}")
                 else:
-                    print(f"{C.YELLOW}No code to save.{C.RESET}")
+                    print(f"{YELLOW}No code to save.{RESET}")
                 continue
             if cmd[0] == "/model":
                 if len(cmd) >= 2:
                     model = cmd[1]
-                    print(f"{C.GREEN}Model set to: {model}{C.RESET}")
+                    print(f"{GREEN}Model set to: {model}{RESET}")
                 else:
-                    print(f"{C.CYAN}Current model: {model}{C.RESET}")
-                    print(f"{C.DIM}Available: {', '.join(list_models())}{C.RESET}")
+                    print(f"{CYAN}Current model: {model}{RESET}")
+                    print(f"{DIM}Available: {', '.join(list_models())}{RESET}")
                 continue
             if cmd[0] == "/auto":
                 if len(cmd) >= 2 and cmd[1] in ("on", "off"):
                     auto_execute = cmd[1] == "on"
-                    print(f"{C.GREEN}Auto-execution: {'ON' if auto_execute else 'OFF'}{C.RESET}")
+                    print(f"{GREEN}Auto-execution: {'ON' if auto_execute else 'OFF'}{RESET}")
                 else:
-                    print(f"{C.CYAN}Auto-execution: {'ON' if auto_execute else 'OFF'}{C.RESET}")
+                    print(f"{CYAN}Auto-execution: {'ON' if auto_execute else 'OFF'}{RESET}")
                 continue
             if cmd[0] == "/max_fix":
                 if len(cmd) >= 2 and cmd[1].isdigit():
                     max_fix_attempts = int(cmd[1])
-                    print(f"{C.GREEN}Max fix attempts: {max_fix_attempts}{C.RESET}")
+                    print(f"{GREEN}Max fix attempts: {max_fix_attempts}{RESET}")
                 else:
-                    print(f"{C.CYAN}Max fix attempts: {max_fix_attempts}{C.RESET}")
+                    print(f"{CYAN}Max fix attempts: {max_fix_attempts}{RESET}")
                 continue
-            print(f"{C.YELLOW}Unknown command. Type /help{C.RESET}")
+            print(f"{YELLOW}Unknown command. Type /help{RESET}")
             continue
 
         # Send to LLM
-        print(f"\n{C.MAGENTA}{C.BOLD}Agent >{C.RESET} {C.DIM}Thinking...{C.RESET}", end="\r", flush=True)
-        ok, response = chat(user_input, model, conversation)
+        print(f"\n{MAGENTA}{BOLD}Agent >{RESET}\n")
+        ok, response = chat(user_input, model, conversation, on_token=print_token)
+        print()
 
         if not ok:
-            print(f"{C.RED}Error: {response}{C.RESET}")
+            print(f"{RED}Error: {response}{RESET}")
             continue
 
         conversation.extend([
             {"role": "user", "content": user_input},
             {"role": "assistant", "content": response}
         ])
-        if len(conversation) > 20:
-            conversation = conversation[-20:]
+        conversation = _trim_by_budget(conversation)
 
         code = extract_code(response)
 
         if code:
             last_code = code
-            print(f"{C.MAGENTA}{C.BOLD}Agent >{C.RESET} Here's the code:\n")
-            print_code(code)
 
             if auto_execute:
-                print(f"\n{C.CYAN}Executing...{C.RESET}")
+                print(f"\n{CYAN}Executing...{RESET}")
                 s, o, e, t = executor.execute(code)
                 print_result(s, o, e, t)
+                if s:
+                    remember_response(response)
+                else:
+                    forget_response(response)
 
                 fix_attempt = 0
                 while not s and fix_attempt < max_fix_attempts:
-                    fix_attempt += 1
-                    print(f"\n{C.YELLOW}Auto-fixing (attempt {fix_attempt}/{max_fix_attempts})...{C.RESET}")
+                    # Each round asks for several candidates in parallel; each one counts as an attempt
+                    k = min(len(FIX_TEMPERATURES), max_fix_attempts - fix_attempt)
+                    print(f"\n{YELLOW}Auto-fixing (attempts {fix_attempt + 1}-{fix_attempt + k}/{max_fix_attempts})...{RESET}")
+                    fix_attempt += k
                     fix_prompt = (
                         f"The code produced an error:\n```\n{e[:500]}\n```\n\n"
                         f"Original code:\n```python\n{code}\n```\n\n"
                         f"Fix the error. Output the complete corrected Python code only."
                     )
-                    fix_ok, fix_resp = chat(fix_prompt, model, conversation)
-                    if fix_ok:
+                    tried = {"replies": 0, "resp": None}
+
+                    # Run each candidate as soon as it arrives; accept the first that runs cleanly
+                    def try_fix(fix_ok, fix_resp):
+                        nonlocal code, last_code, s, o, e, t
+                        if not fix_ok:
+                            return False
+                        tried["replies"] += 1
                         fix_code = extract_code(fix_resp)
-                        if fix_code:
-                            code = fix_code
-                            last_code = code
-                            conversation.extend([
-                                {"role": "user", "content": fix_prompt},
-                                {"role": "assistant", "content": fix_resp}
-                            ])
-                            print(f"\n{C.MAGENTA}{C.BOLD}Agent >{C.RESET} Fixed code:\n")
-                            print_code(code)
-                            print(f"\n{C.CYAN}Re-executing...{C.RESET}")
-                            s, o, e, t = executor.execute(code)
-                            print_result(s, o, e, t)
-                        else:
-                            print(f"{C.RED}Could not extract code from fix.{C.RESET}")
-                            break
-                    else:
-                        print(f"{C.RED}Could not generate fix.{C.RESET}")
+                        if not fix_code:
+                            return False
+                        tried["resp"] = fix_resp
+                        code = fix_code
+                        last_code = code
+                        print(f"\n{MAGENTA}{BOLD}Agent >{RESET} Fixed code:\n")
+                        print_code(code)
+                        print(f"\n{CYAN}Re-executing...{RESET}")
+                        s, o, e, t = executor.execute(code)
+                        print_result(s, o, e, t)
+                        return s
+
+                    fix_batch(fix_prompt, model, k, try_fix, conversation)
+                    if not tried["replies"]:
+                        print(f"{RED}Could not generate fix.{RESET}")
+                        break
+                    if tried["resp"] is None:
+                        print(f"{RED}Could not extract code from fix.{RESET}")
                         break
+                    conversation.extend([
+                        {"role": "user", "content": fix_prompt},
+                        {"role": "assistant", "content": tried["resp"]}
+                    ])
 
                 if not s and fix_attempt >= max_fix_attempts:
-                    print(f"{C.RED}Max fix attempts reached.{C.RESET}")
-        else:
-            clean = strip_think(response)
-            print(f"{C.MAGENTA}{C.BOLD}Agent >{C.RESET} {clean}")
+                    print(f"{RED}Max fix attempts reached.{RESET}")
 
     executor.cleanup()
 
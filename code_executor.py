@@ -4,9 +4,262 @@ Code Executor - Safe Python code execution with timeout and output capture
 import subprocess
 import sys
 import os
-import tempfile
 import time
-import re
+import io
+import ast
+import json
+import signal
+import linecache
+import threading
+import traceback
+import types
+import warnings
+from contextlib import redirect_stdout, redirect_stderr
+from functools import lru_cache
+
+def _parse(code):
+    """ast.parse without compile warnings reaching the agent's terminal;
+    the run itself still reports them."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return ast.parse(code)
+
+
+@lru_cache(maxsize=32)
+def _find_inputs(code):
+    """Locate input() calls in one parse.
+    Returns a tuple of (start, end, prompt_text) character offsets in source order.
+    """
+    try:
+        tree = _parse(code)
+    except SyntaxError:
+        return ()
+    lines = code.split("\n")
+    line_starts = [0]
+    for line in lines:
+        line_starts.append(line_starts[-1] + len(line) + 1)
+
+    def offset(lineno, col):
+        # ast columns are UTF-8 byte offsets
+        prefix = lines[lineno - 1].encode("utf-8")[:col].decode("utf-8", "ignore")
+        return line_starts[lineno - 1] + len(prefix)
+
+    found = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "input":
+            start = offset(node.lineno, node.col_offset)
+            end = offset(node.end_lineno, node.end_col_offset)
+            prompt = None
+            if node.args:
+                arg = node.args[0]
+                if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+                    prompt = arg.value
+                else:
+                    prompt = code[offset(arg.lineno, arg.col_offset):offset(arg.end_lineno, arg.end_col_offset)]
+                    if isinstance(arg, ast.JoinedStr):
+                        prompt = prompt.lstrip("fFrR").strip("\"'")
+            found.append((start, end, prompt or "Enter value"))
+    # Keep only the outermost call when input() calls are nested
+    result = []
+    for start, end, prompt in sorted(found):
+        if not result or start >= result[-1][1]:
+            result.append((start, end, prompt))
+    return tuple(result)
+
+
+# Code touching these modules or calls runs in a separate interpreter, since it
+# can affect the agent's own process or cannot be captured/stopped in-process.
+_ISO_MODULES = {
+    "subprocess", "multiprocessing", "threading", "concurrent", "asyncio", "signal",
+    "ctypes", "socket", "shutil", "tkinter", "turtle",
+}
+_ISO_CALLS = {
+    "system", "popen", "fork", "kill", "_exit", "chdir", "removedirs", "makedirs",
+    "rmtree", "putenv", "setrecursionlimit",
+}
+# Common method names (str.replace, list.remove, ...) that only matter on a filesystem receiver
+_ISO_PATH_CALLS = {"remove", "unlink", "rmdir", "rename", "replace", "mkdir", "write_text", "write_bytes"}
+_FS_MODULES = {"os", "shutil", "pathlib"}
+_ISO_BUILTINS = {"exec", "eval", "compile", "__import__", "globals"}
+# Interpreter-wide state that assignments must not change in the agent's process
+_ISO_TARGETS = {"sys", "builtins", "__builtins__"}
+# Handlers that also catch the in-process timeout, so the run could not be stopped
+_ISO_HANDLERS = {"BaseException", "KeyboardInterrupt"}
+# Extra address space a fast-mode run may allocate before MemoryError
+_INPROC_MEMORY = 512 * 1024 * 1024
+# Spawn-based child processes re-import __main__ by path, so these need a real file
+_MAIN_FILE_MODULES = {"multiprocessing", "concurrent"}
+
+
+def _opens_for_write(call):
+    mode = call.args[1] if len(call.args) > 1 else None
+    for kw in call.keywords:
+        if kw.arg == "mode":
+            mode = kw.value
+    if mode is None:
+        return False
+    if not (isinstance(mode, ast.Constant) and isinstance(mode.value, str)):
+        return True
+    return any(c in mode.value for c in "wax+")
+
+
+def _swallows_interrupt(handler):
+    if handler.type is None:
+        return True
+    types_ = handler.type.elts if isinstance(handler.type, ast.Tuple) else [handler.type]
+    return any(isinstance(t, ast.Name) and t.id in _ISO_HANDLERS for t in types_)
+
+
+def _fs_names(tree):
+    """Names bound to os/shutil/pathlib, Path, or values derived from them."""
+    names = {"os", "shutil", "pathlib", "Path"}
+    bindings = []  # (target, value) pairs
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(a.asname for a in node.names if a.asname and a.name.split(".")[0] in _FS_MODULES)
+        elif isinstance(node, ast.ImportFrom) and (node.module or "").split(".")[0] in _FS_MODULES:
+            names.update(a.asname or a.name for a in node.names)
+        elif isinstance(node, ast.Assign):
+            bindings += [(t, node.value) for t in node.targets]
+        elif isinstance(node, ast.AnnAssign) and node.value is not None:
+            bindings.append((node.target, node.value))
+        elif isinstance(node, ast.With):
+            bindings += [(i.optional_vars, i.context_expr) for i in node.items]
+        elif isinstance(node, (ast.For, ast.comprehension)):
+            bindings.append((node.target, node.iter))
+    # Follow p = Path(...) / "x", for f in p.glob(...) and so on until nothing changes
+    changed = True
+    while changed:
+        changed = False
+        for target, value in bindings:
+            if isinstance(target, ast.Name) and target.id not in names and \
+                    any(isinstance(n, ast.Name) and n.id in names for n in ast.walk(value)):
+                names.add(target.id)
+                changed = True
+    return names
+
+
+def _root_name(expr):
+    """Name an attribute/subscript/call chain hangs off: os for os.path.join(...)[0]."""
+    while True:
+        if isinstance(expr, (ast.Attribute, ast.Subscript)):
+            expr = expr.value
+        elif isinstance(expr, ast.Call):
+            expr = expr.func
+        elif isinstance(expr, ast.BinOp):
+            expr = expr.left
+        else:
+            return expr.id if isinstance(expr, ast.Name) else None
+
+
+@lru_cache(maxsize=32)
+def _needs_isolation(code):
+    """True if code should not run inside the agent's process."""
+    try:
+        tree = _parse(code)
+    except SyntaxError:
+        return True
+    fs_names = None
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            if any(a.name.split(".")[0] in _ISO_MODULES for a in node.names):
+                return True
+        elif isinstance(node, ast.ImportFrom):
+            module = (node.module or "").split(".")[0]
+            if module in _ISO_MODULES:
+                return True
+            if module in _FS_MODULES and any(a.name in _ISO_CALLS | _ISO_PATH_CALLS for a in node.names):
+                return True
+        elif isinstance(node, ast.ExceptHandler):
+            if _swallows_interrupt(node):
+                return True
+        elif isinstance(node, (ast.Assign, ast.AugAssign, ast.AnnAssign, ast.Delete)):
+            targets = node.targets if isinstance(node, (ast.Assign, ast.Delete)) else [node.target]
+            if any(isinstance(t, (ast.Attribute, ast.Subscript)) and _root_name(t) in _ISO_TARGETS
+                   for t in targets):
+                return True
+        elif isinstance(node, ast.Call):
+            func = node.func
+            if isinstance(func, ast.Attribute):
+                if func.attr in _ISO_CALLS or (func.attr == "open" and _opens_for_write(node)):
+                    return True
+                if func.attr in _ISO_PATH_CALLS:
+                    if fs_names is None:
+                        fs_names = _fs_names(tree)
+                    if _root_name(func.value) in fs_names:
+                        return True
+            elif isinstance(func, ast.Name):
+                if func.id in _ISO_BUILTINS or (func.id == "open" and _opens_for_write(node)):
+                    return True
+    return False
+
+
+@lru_cache(maxsize=32)
+def _needs_main_file(code):
+    """True if code may start child interpreters that re-import it from disk."""
+    try:
+        tree = _parse(code)
+    except SyntaxError:
+        return False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            names = [node.module or ""]
+        else:
+            continue
+        if any(name.split(".")[0] in _MAIN_FILE_MODULES for name in names):
+            return True
+    return False
+
+
+def _in_dir(path, directory):
+    """True if path lies inside directory."""
+    try:
+        return os.path.commonpath([os.path.abspath(path), directory]) == directory
+    except ValueError:
+        return False
+
+
+def _captured_stream():
+    """In-memory stand-in for sys.stdout/stderr that, like the real ones, has
+    .buffer, .encoding and .reconfigure()."""
+    return io.TextIOWrapper(io.BytesIO(), encoding="utf-8", write_through=True)
+
+
+def _captured_text(stream):
+    try:
+        stream.flush()
+        return stream.buffer.getvalue().decode("utf-8", "replace")
+    except ValueError:  # closed or detached by the code
+        return ""
+
+
+class _InprocTimeout(BaseException):
+    pass
+
+
+# Pre-spawned interpreter that runs exactly one script, so an execution skips
+# interpreter startup but still starts from a clean process. The job is one JSON
+# line {code} on stdin and the rest of stdin is the script's input; output and
+# exit status are the process's own.
+_WORKER_SRC = r"""
+import json, linecache, sys, traceback, types
+code = json.loads(sys.stdin.buffer.readline())["code"]
+sys.argv = ["<agent>"]
+linecache.cache["<agent>"] = (len(code), None, (code + "\n").splitlines(True), "<agent>")
+# Run in a real __main__ module so pickle and get_type_hints can find its globals
+main = types.ModuleType("__main__")
+main.__file__ = "<agent>"
+sys.modules["__main__"] = main
+try:
+    exec(compile(code, "<agent>", "exec"), main.__dict__)
+except SystemExit:
+    raise
+except BaseException as e:
+    traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+    sys.exit(1)
+"""
 
 
 class CodeExecutor:
@@ -17,8 +270,19 @@ class CodeExecutor:
         self.last_output = None
         self.last_error = None
         self.last_returncode = None
-        self.work_dir = tempfile.mkdtemp(prefix="agent_exec_")
+        self.work_dir = None  # created by start()
         self.input_callback = None  # GUI callback for input()
+        self._compile_cache = {}  # source -> (code object, warnings), so /run skips recompiling
+        self._worker = None
+
+    def start(self):
+        """Create the work dir and boot the warm worker, if not done yet.
+        Runs on first use; call it earlier to let the worker start in the background.
+        """
+        if self.work_dir is None:
+            import tempfile
+            self.work_dir = tempfile.mkdtemp(prefix="agent_exec_")
+            self._start_worker()
 
     def set_input_callback(self, callback):
         """Set a callback function for handling input() prompts.
@@ -26,70 +290,288 @@ class CodeExecutor:
         """
         self.input_callback = callback
 
+    def _start_worker(self):
+        try:
+            self._worker = subprocess.Popen(
+                [self.python_path, "-c", _WORKER_SRC],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=self.work_dir,
+                env=self._safe_env()
+            )
+        except OSError:
+            self._worker = None
+
+    def _stop_worker(self):
+        if self._worker is not None:
+            try:
+                self._worker.kill()
+                self._worker.wait()
+            except OSError:
+                pass
+            self._worker = None
+
+    def _run_in_worker(self, code, input_data):
+        """Run code in the pre-spawned worker and spawn the next one.
+        Returns (returncode, stdout, stderr), or None if no worker could take the
+        job, in which case nothing has run.
+        Raises subprocess.TimeoutExpired if the run exceeds the timeout.
+        """
+        if self._worker is None or self._worker.poll() is not None:
+            self._start_worker()
+            if self._worker is None:
+                return None
+        worker = self._worker
+        # Warm up the next interpreter while this one runs
+        self._start_worker()
+        try:
+            worker.stdin.write((json.dumps({"code": code}) + "\n").encode("utf-8"))
+            worker.stdin.flush()
+        except OSError:
+            worker.kill()
+            worker.wait()
+            return None
+        # From here on the code may have run, so report whatever the worker did
+        try:
+            out, err = worker.communicate((input_data or "").encode("utf-8"), timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            worker.kill()
+            worker.communicate()
+            raise
+        out, err = out.decode("utf-8", "replace"), err.decode("utf-8", "replace")
+        if worker.returncode < 0:
+            try:
+                name = signal.Signals(-worker.returncode).name
+            except ValueError:
+                name = f"signal {-worker.returncode}"
+            err += f"Process terminated by {name}\n"
+        return worker.returncode, out, err
+
     def _detect_inputs(self, code):
-        """Detect input() calls and return list of (full_match, prompt_text)."""
-        pattern = r'input\s*\(\s*(?:f?["\x27](.*?)["\x27])?\s*\)'
-        matches = []
-        for m in re.finditer(pattern, code):
-            full = m.group(0)
-            prompt = m.group(1) if m.group(1) else "Enter value"
-            matches.append((full, prompt))
-        return matches
-
-    def _replace_inputs(self, code, values):
-        """Replace input() calls with provided values."""
-        result = code
-        for (full_match, _), value in zip(self._detect_inputs(code), values):
-            escaped = value.replace("\\", "\\\\").replace('"', '\\"')
-            result = result.replace(full_match, f'"{escaped}"', 1)
-        return result
-
-    def execute(self, code, input_data=None):
+        """Detect input() calls and return list of (start, end, prompt_text)."""
+        return list(_find_inputs(code))
+
+    def _replace_inputs(self, code, inputs, values):
+        """Replace the detected input() calls with provided values in a single pass."""
+        parts = []
+        last = 0
+        for (start, end, _), value in zip(inputs, values):
+            parts.append(code[last:start])
+            # A JSON string is also a valid Python string literal, with all escaping done in C
+            parts.append(json.dumps(value, ensure_ascii=False))
+            last = end
+        parts.append(code[last:])
+        return "".join(parts)
+
+    def _compile(self, code):
+        """Compile code once per distinct source. Raises SyntaxError.
+        Returns (code object, compile warnings); the warnings are recorded rather
+        than printed, so only the run itself reports them.
+        """
+        compiled = self._compile_cache.get(code)
+        if compiled is None:
+            if len(self._compile_cache) >= 32:
+                self._compile_cache.clear()
+            with warnings.catch_warnings(record=True) as caught:
+                compiled = self._compile_cache[code] = compile(code, "<agent>", "exec"), caught
+        return compiled
+
+    def _arm_timeout(self, timed_out):
+        """Interrupt the main thread after self.timeout. Returns a disarm function."""
+        def on_timeout(*_):
+            timed_out.append(True)
+            if hasattr(signal, "SIGALRM"):
+                raise _InprocTimeout()
+            import _thread
+            _thread.interrupt_main()
+
+        if hasattr(signal, "SIGALRM"):
+            previous = signal.signal(signal.SIGALRM, on_timeout)
+            # Keep re-firing in case the code swallows the first interrupt
+            signal.setitimer(signal.ITIMER_REAL, self.timeout, 0.1)
+
+            def disarm():
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                signal.signal(signal.SIGALRM, previous)
+            return disarm
+        timer = threading.Timer(self.timeout, on_timeout)
+        timer.start()
+        return timer.cancel
+
+    def _limit_memory(self):
+        """Cap the address space at current usage plus _INPROC_MEMORY, so a runaway
+        allocation raises MemoryError instead of taking the agent down.
+        Returns a function restoring the previous limit; a no-op where unsupported.
+        """
+        try:
+            import resource
+            with open("/proc/self/statm") as f:
+                used = int(f.read().split()[0]) * resource.getpagesize()
+            soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+            cap = used + _INPROC_MEMORY
+            if hard != resource.RLIM_INFINITY:
+                cap = min(cap, hard)
+            if soft != resource.RLIM_INFINITY and soft <= cap:
+                return lambda: None
+            resource.setrlimit(resource.RLIMIT_AS, (cap, hard))
+        except (ImportError, OSError, ValueError):
+            return lambda: None
+        return lambda: resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+    def execute_inproc(self, code, input_data=None):
+        """
+        Execute Python code inside this process, skipping interpreter startup
+        and pipe I/O. Only for code without side effects on the host process;
+        must be called from the main thread.
+        Returns (success, stdout, stderr, execution_time)
         """
-        Execute Python code in a subprocess.
+        self.start()
+        self.last_code = code
+        out, err = _captured_stream(), _captured_stream()
+        main = types.ModuleType("__main__")
+        main.__file__ = "<agent>"
+        linecache.cache["<agent>"] = (len(code), None, (code + "\n").splitlines(True), "<agent>")
+        returncode = 0
+        timed_out = []
+        saved_cwd, saved_stdin, saved_main = os.getcwd(), sys.stdin, sys.modules["__main__"]
+        saved_env, saved_path = dict(os.environ), sys.path[:]
+        modules_before = set(sys.modules)
+        start_time = time.time()
+
+        disarm = self._arm_timeout(timed_out)
+        unlimit = self._limit_memory()
+        try:
+            os.chdir(self.work_dir)
+            sys.path.insert(0, self.work_dir)
+            sys.stdin = io.StringIO(input_data or "")
+            sys.modules["__main__"] = main
+            with redirect_stdout(out), redirect_stderr(err):
+                try:
+                    compiled, caught = self._compile(code)
+                    for w in caught:
+                        sys.stderr.write(warnings.formatwarning(w.message, w.category, w.filename, w.lineno))
+                    exec(compiled, main.__dict__)
+                except SystemExit as e:
+                    if e.code is None or isinstance(e.code, int):
+                        returncode = e.code or 0
+                    else:
+                        print(e.code, file=sys.stderr)
+                        returncode = 1
+                except (_InprocTimeout, KeyboardInterrupt):
+                    if not timed_out:
+                        raise
+                    raise _InprocTimeout()
+                except BaseException as e:
+                    returncode = 1
+                    traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        except _InprocTimeout:
+            returncode = -1
+        finally:
+            disarm()
+            unlimit()
+            os.chdir(saved_cwd)
+            if os.environ != saved_env:
+                os.environ.clear()
+                os.environ.update(saved_env)
+            sys.stdin = saved_stdin
+            sys.modules["__main__"] = saved_main
+            sys.path[:] = saved_path
+            # Forget modules imported from the work dir so edits are picked up next run
+            for name in set(sys.modules) - modules_before:
+                path = getattr(sys.modules[name], "__file__", None)
+                if path and _in_dir(path, self.work_dir):
+                    del sys.modules[name]
+
+        elapsed = time.time() - start_time
+        if timed_out:
+            self.last_error = f"Execution timed out ({self.timeout}s)"
+            self.last_returncode = -1
+            return False, _captured_text(out), self.last_error, elapsed
+        self.last_output = _captured_text(out)
+        self.last_error = _captured_text(err)
+        self.last_returncode = returncode
+        return returncode == 0, self.last_output, self.last_error, elapsed
+
+    def execute(self, code, input_data=None, mode=None):
+        """
+        Execute Python code.
+        By default it runs in a separate, killable interpreter. mode="fast" opts
+        in to running it in this process, unless the code looks like it has side
+        effects or could resist the timeout.
         If input() calls are detected and a callback is set,
         prompts the user via GUI and replaces them.
         Returns (success, stdout, stderr, execution_time)
         """
+        self.start()
         self.last_code = code
 
         # Detect and handle input() calls
         inputs = self._detect_inputs(code)
         if inputs and self.input_callback and input_data is None:
             values = []
-            for full_match, prompt in inputs:
+            for _, _, prompt in inputs:
                 value = self.input_callback(prompt)
                 if value is None:  # User cancelled
                     return False, "", "Cancelled by user", 0.0
                 values.append(value)
-            code = self._replace_inputs(code, values)
+            code = self._replace_inputs(code, inputs, values)
+
+        # The in-process timeout interrupts the main thread, so only use it from there
+        if mode == "fast" and not _needs_isolation(code) and \
+                threading.current_thread() is threading.main_thread():
+            return self.execute_inproc(code, input_data)
 
-        # Write code to temp file
-        code_file = os.path.join(self.work_dir, "run_code.py")
-        with open(code_file, "w", encoding="utf-8") as f:
-            f.write(code)
+        # A syntax error fails the same way in any interpreter: report it without a round-trip
+        try:
+            self._compile(code)
+        except (SyntaxError, ValueError) as e:
+            self.last_output = ""
+            self.last_error = "".join(traceback.format_exception_only(type(e), e))
+            self.last_returncode = 1
+            return False, "", self.last_error, 0.0
 
         start_time = time.time()
 
         try:
-            result = subprocess.run(
-                [self.python_path, code_file],
-                capture_output=True,
-                text=True,
-                encoding='utf-8',
-                timeout=self.timeout,
-                cwd=self.work_dir,
-                input=input_data,
-                env=self._safe_env()
-            )
+            result = None if _needs_main_file(code) else self._run_in_worker(code, input_data)
+            if result is None:
+                # Worker unusable for this code or unable to take the job: fall back to
+                # a fresh interpreter. The code goes over stdin, or via the environment
+                # when stdin carries input_data.
+                env = self._safe_env()
+                if _needs_main_file(code):
+                    code_file = os.path.join(self.work_dir, "run_code.py")
+                    with open(code_file, "w", encoding="utf-8") as f:
+                        f.write(code)
+                    args, stdin = [self.python_path, code_file], input_data
+                elif input_data is None:
+                    args, stdin = [self.python_path, "-"], code
+                else:
+                    env["AGENT_CODE"] = code
+                    args = [self.python_path, "-c",
+                            "import os; exec(compile(os.environ['AGENT_CODE'], '<agent>', 'exec'))"]
+                    stdin = input_data
+                proc = subprocess.run(
+                    args,
+                    capture_output=True,
+                    text=True,
+                    encoding='utf-8',
+                    timeout=self.timeout,
+                    cwd=self.work_dir,
+                    input=stdin,
+                    env=env
+                )
+                result = proc.returncode, proc.stdout, proc.stderr
+            returncode, stdout, stderr = result
 
             elapsed = time.time() - start_time
-            self.last_output = result.stdout
-            self.last_error = result.stderr
-            self.last_returncode = result.returncode
+            self.last_output = stdout
+            self.last_error = stderr
+            self.last_returncode = returncode
 
-            success = result.returncode == 0
-            return success, result.stdout, result.stderr, elapsed
+            success = returncode == 0
+            return success, stdout, stderr, elapsed
 
         except subprocess.TimeoutExpired:
             elapsed = time.time() - start_time
@@ -105,6 +587,7 @@ class CodeExecutor:
 
     def execute_with_file(self, code, file_path):
         """Execute code that operates on a specific file."""
+        self.start()
         if file_path and os.path.isfile(file_path):
             import shutil
             dest = os.path.join(self.work_dir, os.path.basename(file_path))
@@ -120,12 +603,14 @@ class CodeExecutor:
         return env
 
     def get_work_dir(self):
+        self.start()
         return self.work_dir
 
     def cleanup(self):
         import shutil
+        self._stop_worker()
         try:
-            if os.path.exists(self.work_dir):
+            if self.work_dir and os.path.exists(self.work_dir):
                 shutil.rmtree(self.work_dir, ignore_errors=True)
         except Exception:
             pass
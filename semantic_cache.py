@@ -0,0 +1,108 @@
+"""
+Semantic Cache - Reuse LLM responses for repeated or near-identical prompts
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+class SemanticCache:
+    def __init__(self, path, embed, threshold=0.95, max_entries=512):
+        self.path = path
+        self.embed = embed  # embed(text) -> list of floats, or None on failure
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.enabled = True
+        self.vecs = None  # float32 [N, D], rows L2-normalised
+        self.resps = []
+        self.ctx = []  # context-chain hash per entry
+        self.dirty = False
+        self._load()
+
+    @staticmethod
+    def context_hash(messages):
+        """Hash the messages that precede the prompt, so a hit is only
+        returned when the surrounding conversation is identical."""
+        blob = json.dumps(messages, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+    def _load(self):
+        try:
+            with np.load(self.path) as data:
+                self.vecs = data["vecs"].astype(np.float32)
+                meta = json.loads(data["meta"].item())
+            self.resps, self.ctx = meta["resps"], meta["ctx"]
+        except Exception:
+            # Missing, truncated or old-format file: start empty, it is only a cache
+            self.vecs, self.resps, self.ctx = None, [], []
+
+    def save(self):
+        if not self.dirty:
+            return
+        try:
+            if self.vecs is None:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+            else:
+                # Responses go in as one JSON string; a numpy string array would
+                # pad every entry to the longest response
+                meta = json.dumps({"resps": self.resps, "ctx": self.ctx}, ensure_ascii=False)
+                # Write aside and swap in, so an interrupted exit never leaves a torn file
+                tmp = self.path + ".tmp"
+                with open(tmp, "wb") as f:
+                    np.savez_compressed(f, vecs=self.vecs, meta=np.array(meta))
+                os.replace(tmp, self.path)
+            self.dirty = False
+        except OSError:
+            pass
+
+    def _embed(self, text):
+        if not self.enabled:
+            return None
+        vec = self.embed(text)
+        if not vec:
+            # Embedding model missing or server error: stop trying this session
+            self.enabled = False
+            return None
+        vec = np.asarray(vec, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else None
+
+    def lookup(self, text, ctx_hash):
+        """Return (embedding, cached_response or None)."""
+        vec = self._embed(text)
+        if vec is None or self.vecs is None or vec.shape[0] != self.vecs.shape[1]:
+            return vec, None
+        sims = self.vecs @ vec
+        sims[np.asarray(self.ctx) != ctx_hash] = -1.0
+        i = int(np.argmax(sims))
+        if sims[i] >= self.threshold:
+            return vec, self.resps[i]
+        return vec, None
+
+    def add(self, vec, ctx_hash, response):
+        if vec is None:
+            return
+        if self.vecs is None or vec.shape[0] != self.vecs.shape[1]:
+            # First entry, or the embedding model changed
+            self.vecs, self.resps, self.ctx = vec[None, :], [response], [ctx_hash]
+        else:
+            self.vecs = np.vstack([self.vecs, vec])[-self.max_entries:]
+            self.resps = (self.resps + [response])[-self.max_entries:]
+            self.ctx = (self.ctx + [ctx_hash])[-self.max_entries:]
+        self.dirty = True
+
+    def remove(self, response):
+        """Drop every entry that returns response."""
+        keep = [i for i, r in enumerate(self.resps) if r != response]
+        if len(keep) == len(self.resps):
+            return
+        if keep:
+            self.vecs = self.vecs[keep]
+            self.resps = [self.resps[i] for i in keep]
+            self.ctx = [self.ctx[i] for i in keep]
+        else:
+            self.vecs, self.resps, self.ctx = None, [], []
+        self.dirty = True
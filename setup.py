@@ -4,19 +4,29 @@ Downloads the fine-tuned model from HuggingFace and registers it with Ollama.
 """
 import os
 import sys
+import json
+import hashlib
 import subprocess
-import urllib.request
 import shutil
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import blake3
+import httpx
 
 MODEL_NAME = "qwen3-coder-v4"
 HF_REPO = "08210821iy/Qwen3-4B-Coder"
 GGUF_FILE = "model-q4_k_m.gguf"
 GGUF_URL = f"https://huggingface.co/{HF_REPO}/resolve/main/{GGUF_FILE}"
 FALLBACK_MODEL = "qwen3:4b"
+OLLAMA_BASE = "http://localhost:11434"
 
 MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
 GGUF_PATH = os.path.join(MODEL_DIR, GGUF_FILE)
+CHECKSUM_PATH = GGUF_PATH + ".b3"  # digest recorded after the last good download
+DOWNLOAD_WORKERS = 8
+CHUNK_SIZE = 64 * 1024 * 1024  # resume granularity
 
 MODELFILE_CONTENT = """FROM {gguf_path}
 
@@ -44,7 +54,17 @@ class C:
     RESET = "\033[0m"
 
 
+# One connection for all the Ollama API checks
+_client = httpx.Client(base_url=OLLAMA_BASE, timeout=5)
+
+
 def check_ollama():
+    try:
+        return _client.get("/api/version").status_code == 200
+    except httpx.ConnectError:
+        pass  # Server not running: fall back to checking the CLI is installed
+    except httpx.HTTPError:
+        return False
     try:
         result = subprocess.run(["ollama", "--version"], capture_output=True, text=True, timeout=10)
         return result.returncode == 0
@@ -53,6 +73,14 @@ def check_ollama():
 
 
 def check_model_exists():
+    try:
+        models = _client.get("/api/tags").json().get("models", [])
+        names = {m["name"] for m in models}
+        return MODEL_NAME in names or MODEL_NAME in {n.split(":")[0] for n in names}
+    except httpx.ConnectError:
+        pass
+    except Exception:
+        return False
     try:
         result = subprocess.run(["ollama", "list"], capture_output=True, text=True, timeout=10)
         return MODEL_NAME in result.stdout
@@ -72,47 +100,235 @@ def download_progress(block_num, block_size, total_size):
         print(f"\r  {C.CYAN}[{bar}] {pct:.1f}% ({mb_done:.0f}/{mb_total:.0f} MB){C.RESET}", end="", flush=True)
 
 
+def download_ranges(url, path, workers=DOWNLOAD_WORKERS, chunk_size=CHUNK_SIZE):
+    """Download url to path using parallel HTTP range requests.
+    Data goes to <path>.part; finished chunks are recorded in <path>.parts so an
+    interrupted download resumes where it left off.
+    """
+    part_path = path + ".part"
+    state_path = path + ".parts"
+    with httpx.Client(follow_redirects=True, timeout=httpx.Timeout(60.0, connect=10.0)) as client:
+        head = client.head(url)
+        head.raise_for_status()
+        total = int(head.headers.get("Content-Length", 0))
+
+        if total <= 0 or head.headers.get("Accept-Ranges") != "bytes":
+            # Server can't do ranges: plain single stream
+            with client.stream("GET", url) as r, open(part_path, "wb") as f:
+                r.raise_for_status()
+                done = 0
+                for data in r.iter_bytes(1 << 20):
+                    f.write(data)
+                    done += len(data)
+                    download_progress(done, 1, total)
+            os.replace(part_path, path)
+            return
+
+        chunks = [(a, min(a + chunk_size, total) - 1) for a in range(0, total, chunk_size)]
+        finished = set()
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+            if state["size"] == total and state["chunk_size"] == chunk_size and os.path.exists(part_path):
+                finished = set(state["done"])
+        except (OSError, ValueError, KeyError):
+            pass
+        if not finished:
+            with open(part_path, "wb") as f:
+                f.truncate(total)
+
+        lock = threading.Lock()
+        progress = [sum(chunks[i][1] - chunks[i][0] + 1 for i in finished)]
+
+        def fetch(i):
+            start, end = chunks[i]
+            with open(part_path, "r+b") as f:
+                f.seek(start)
+                with client.stream("GET", url, headers={"Range": f"bytes={start}-{end}"}) as r:
+                    if r.status_code != 206:
+                        raise IOError(f"range request failed (HTTP {r.status_code})")
+                    for data in r.iter_bytes(1 << 20):
+                        f.write(data)
+                        with lock:
+                            progress[0] += len(data)
+                            download_progress(progress[0], 1, total)
+            with lock:
+                finished.add(i)
+                with open(state_path, "w") as f:
+                    json.dump({"size": total, "chunk_size": chunk_size, "done": sorted(finished)}, f)
+
+        pending = [i for i in range(len(chunks)) if i not in finished]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(fetch, pending))
+
+    os.replace(part_path, path)
+    if os.path.exists(state_path):
+        os.remove(state_path)
+
+
+def file_digests(path, with_sha256=False):
+    """BLAKE3 hex digest of a file, hashed on all cores, and optionally its
+    SHA-256 from the same read (None otherwise)."""
+    h = blake3.blake3(max_threads=blake3.blake3.AUTO)
+    sha = hashlib.sha256() if with_sha256 else None
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 24), b""):
+            h.update(block)
+            if sha is not None:
+                sha.update(block)
+    return h.hexdigest(), sha.hexdigest() if sha is not None else None
+
+
+def published_info():
+    """(size, sha256) of the GGUF as published on HuggingFace; either may be None.
+    LFS files carry both on the resolve redirect as X-Linked-Size / X-Linked-Etag.
+    """
+    size = sha256 = None
+    try:
+        r = httpx.head(GGUF_URL, follow_redirects=True, timeout=10)
+        r.raise_for_status()
+    except httpx.HTTPError:
+        return None, None
+    for resp in r.history + [r]:
+        etag = resp.headers.get("X-Linked-Etag", "").strip('"').lower()
+        if len(etag) == 64 and sha256 is None:
+            sha256 = etag
+        linked = resp.headers.get("X-Linked-Size")
+        if linked and linked.isdigit() and size is None:
+            size = int(linked)
+    if size is None and r.headers.get("Content-Length", "").isdigit():
+        size = int(r.headers["Content-Length"])
+    return size, sha256
+
+
+def recorded_digest():
+    try:
+        with open(CHECKSUM_PATH) as f:
+            return f.read().split()[0]
+    except (OSError, IndexError):
+        return None
+
+
+def record_digest(digest):
+    with open(CHECKSUM_PATH, "w") as f:
+        f.write(f"{digest}  {GGUF_FILE}\n")
+
+
+def verify_gguf(expected, size, sha256):
+    """Check GGUF_PATH against what is known about it: the expected BLAKE3 digest,
+    else the published SHA-256, plus the published size and the GGUF magic.
+    Returns (ok, blake3 digest), the digest being None if nothing could be hashed against.
+    """
+    if size and os.path.getsize(GGUF_PATH) != size:
+        return False, None
+    with open(GGUF_PATH, "rb") as f:
+        if f.read(4) != b"GGUF":
+            return False, None
+    if expected:
+        digest, _ = file_digests(GGUF_PATH)
+        return digest == expected, digest
+    if sha256:
+        digest, actual = file_digests(GGUF_PATH, with_sha256=True)
+        return actual == sha256, digest
+    return True, None
+
+
 def download_gguf():
     os.makedirs(MODEL_DIR, exist_ok=True)
+    size, sha256 = published_info()
     if os.path.exists(GGUF_PATH):
         size_gb = os.path.getsize(GGUF_PATH) / 1024 / 1024 / 1024
-        print(f"  {C.GREEN}Model already downloaded ({size_gb:.2f} GB){C.RESET}")
-        return True
+        print(f"  {C.DIM}Verifying existing model...{C.RESET}")
+        ok, digest = verify_gguf(recorded_digest(), size, sha256)
+        if ok:
+            if digest:
+                record_digest(digest)
+            else:
+                print(f"  {C.YELLOW}No published checksum to verify against{C.RESET}")
+            print(f"  {C.GREEN}Model already downloaded ({size_gb:.2f} GB){C.RESET}")
+            return True
+        print(f"  {C.YELLOW}Existing model is incomplete or corrupt, downloading again{C.RESET}")
+        os.remove(GGUF_PATH)
+        if os.path.exists(CHECKSUM_PATH):
+            os.remove(CHECKSUM_PATH)
     print(f"  {C.CYAN}Downloading model from HuggingFace...{C.RESET}")
     print(f"  {C.DIM}{GGUF_URL}{C.RESET}")
     print(f"  {C.DIM}Size: ~2.33 GB (may take 5-10 minutes){C.RESET}")
     try:
-        urllib.request.urlretrieve(GGUF_URL, GGUF_PATH, reporthook=download_progress)
+        download_ranges(GGUF_URL, GGUF_PATH)
         print()
+        print(f"  {C.DIM}Verifying download...{C.RESET}")
+        ok, digest = verify_gguf(None, size, sha256)
+        if not ok:
+            os.remove(GGUF_PATH)
+            raise IOError("downloaded file failed verification")
+        if digest:
+            record_digest(digest)
+        else:
+            print(f"  {C.YELLOW}No published checksum to verify against{C.RESET}")
         size_gb = os.path.getsize(GGUF_PATH) / 1024 / 1024 / 1024
         print(f"  {C.GREEN}Download complete ({size_gb:.2f} GB){C.RESET}")
         return True
     except Exception as e:
         print(f"\n  {C.RED}Download failed: {e}{C.RESET}")
-        if os.path.exists(GGUF_PATH):
-            os.remove(GGUF_PATH)
+        print(f"  {C.DIM}Run setup again to resume the download.{C.RESET}")
         return False
 
 
+def create_via_api(content):
+    """Create the model with POST /api/create, printing progress as it streams.
+    Raises on connection or server errors.
+    """
+    status = ""
+    with _client.stream("POST", "/api/create", json={
+        "model": MODEL_NAME,
+        "name": MODEL_NAME,
+        "modelfile": content
+    }, timeout=None) as r:
+        for line in r.iter_lines():
+            if not line:
+                continue
+            msg = json.loads(line)
+            if "error" in msg:
+                raise RuntimeError(msg["error"])
+            status = msg.get("status", status)
+            print(f"  {C.DIM}{status}{C.RESET}")
+    return status == "success"
+
+
+def create_via_cli(content):
+    """Create the model with 'ollama create', printing its output as it runs."""
+    modelfile_path = os.path.join(MODEL_DIR, "Modelfile")
+    with open(modelfile_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    proc = subprocess.Popen(
+        ["ollama", "create", MODEL_NAME, "-f", modelfile_path],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+    for line in proc.stdout:
+        if line.strip():
+            print(f"  {C.DIM}{line.strip()}{C.RESET}")
+    return proc.wait() == 0
+
+
 def register_model():
     if check_model_exists():
         print(f"  {C.GREEN}Model '{MODEL_NAME}' already registered in Ollama{C.RESET}")
         return True
     print(f"  {C.CYAN}Registering model with Ollama...{C.RESET}")
     content = MODELFILE_CONTENT.format(gguf_path=GGUF_PATH.replace("\\", "/"))
-    modelfile_path = os.path.join(MODEL_DIR, "Modelfile")
-    with open(modelfile_path, "w", encoding="utf-8") as f:
-        f.write(content)
     try:
-        result = subprocess.run(
-            ["ollama", "create", MODEL_NAME, "-f", modelfile_path],
-            capture_output=True, text=True, timeout=120
-        )
-        if result.returncode == 0:
+        try:
+            ok = create_via_api(content)
+        except (httpx.HTTPError, RuntimeError, ValueError) as e:
+            # Newer servers no longer accept a raw Modelfile over the API
+            print(f"  {C.DIM}API create failed ({e}), trying the ollama CLI...{C.RESET}")
+            ok = create_via_cli(content)
+        if ok:
             print(f"  {C.GREEN}Model '{MODEL_NAME}' registered successfully{C.RESET}")
             return True
         else:
-            print(f"  {C.RED}Registration failed: {result.stderr}{C.RESET}")
+            print(f"  {C.RED}Registration failed{C.RESET}")
             return False
     except Exception as e:
         print(f"  {C.RED}Registration failed: {e}{C.RESET}")